@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the memory used by the compact and plain config representations.
+
+Loads the same generated multi-tenant config into a :class:`ConfigLoader`,
+a :class:`CompactConfigLoader`, and a :class:`CompactConfigLoader` that is
+then compacted with ``arrays=True``, and reports the memory traced by
+:py:mod:`tracemalloc` for each. Run ``make memory``, or for example::
+
+    python benchmarks/memory.py --tenants 20 --size 50000
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import io
+import json
+import sys
+import tracemalloc
+
+from configloader import CompactConfigLoader, ConfigLoader
+
+
+def main(argv=None):
+    """Run the comparison and print a report."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--tenants', type=int, default=4,
+        help='number of tenants sharing keys and values (default: '
+        '%(default)s)',
+    )
+    parser.add_argument(
+        '--size', type=int, default=10000,
+        help='number of keys per tenant (default: %(default)s)',
+    )
+    args = parser.parse_args(argv)
+
+    data = [generate(tenant, args.size) for tenant in range(args.tenants)]
+    plain = measure(data, ConfigLoader)
+    print('{0:>20}: {1:10.1f} MiB'.format('ConfigLoader', plain / 2 ** 20))
+    for name, config_class, compact_kwargs in [
+            ('CompactConfigLoader', CompactConfigLoader, None),
+            ('... with arrays', CompactConfigLoader, {'arrays': True}),
+            ]:
+        used = measure(data, config_class, compact_kwargs)
+        print('{0:>20}: {1:10.1f} MiB ({2:+.1%})'.format(
+            name, used / 2 ** 20, used / plain - 1,
+        ))
+    return 0
+
+
+def generate(tenant, size):
+    """Return one tenant's config as JSON."""
+    return json.dumps(dict(
+        ('TENANT{0}_SETTING{1}'.format(tenant, i), {
+            'host': 'db-{0}.internal.example.com'.format(i % 10),
+            'weights': [j / 4.0 for j in range(i % 20)],
+        })
+        for i in range(size)
+    ))
+
+
+def measure(data, config_class, compact_kwargs=None):
+    """Return the bytes still allocated after loading ``data``."""
+    tracemalloc.start()
+    try:
+        config = config_class()
+        for chunk in data:
+            config.update_from_json_file(io.StringIO(chunk))
+        if compact_kwargs:
+            config.compact(**compact_kwargs)
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Stress test for reading a ConfigLoader while it is being reloaded.
+
+Reader threads repeatedly look up values by item access, attribute access
+(when AttrDict is installed), :meth:`ConfigLoader.namespace` and
+:meth:`ConfigLoader.snapshot`, while a writer thread keeps reloading a
+generated config with :meth:`ConfigLoader.update_from_json_file`.
+
+Every value in a given generation of the config holds that generation's
+number, and each generation also adds one new key, so the key set keeps
+changing too. A snapshot or namespace whose values mix generations, or
+whose added keys don't match its generation, is a torn read. Single reads
+are checked to never go back to an older generation than one already seen.
+
+Throughput and p50/p99 latency are reported for each kind of read, along
+with the number of reloads and the peak memory use. The exit status is 1 if
+any inconsistency was seen. Run ``make stress``, or for example::
+
+    python benchmarks/stress.py --size 100000 --duration 10 --readers 8
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import io
+import json
+import random
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import configloader
+from configloader import ConfigLoader
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# Look up a namespace only every so often, as it copies part of the config
+NAMESPACE_INTERVAL = 50
+SNAPSHOT_INTERVAL = 200
+
+
+def main(argv=None):
+    """Run the stress test and print a report."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--size', type=int, default=10000,
+        help='number of top-level keys in the config (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--duration', type=float, default=5,
+        help='seconds to run for (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--readers', type=int, default=4,
+        help='number of reader threads (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--trace-memory', action='store_true',
+        help='measure peak memory with tracemalloc (slower, but excludes '
+        'the interpreter itself)',
+    )
+    args = parser.parse_args(argv)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    config = ConfigLoader()
+    config.update_from_json_file(io.StringIO(generate(args.size, 0)))
+    stop = threading.Event()
+    writer = Writer(config, args.size, stop)
+    readers = [Reader(config, args.size, stop) for _ in range(args.readers)]
+
+    threads = [threading.Thread(target=writer.run)]
+    threads.extend(threading.Thread(target=reader.run) for reader in readers)
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report(args, writer, readers)
+    errors = writer.errors + [
+        error for reader in readers for error in reader.errors
+    ]
+    for error in errors[:10]:
+        print('ERROR: {0}'.format(error))
+    return 1 if errors else 0
+
+
+def generate(size, generation):
+    """
+    Return a JSON config in which every value holds ``generation``.
+
+    Besides the ``size`` fixed keys, generation N adds the key
+    ``APP_ADDEDN``, so after N reloads the config holds the added keys for
+    generations 1 to N.
+    """
+    config = {}
+    for i in range(size):
+        prefix = 'APP' if i % 2 else 'LIB'
+        config['{0}_KEY{1}'.format(prefix, i)] = {'generation': generation}
+    if generation:
+        config['APP_ADDED{0}'.format(generation)] = {'generation': generation}
+    return json.dumps(config)
+
+
+def check_consistent(config, prefix=''):
+    """Return a description of any inconsistency in a copy of the config."""
+    generations = set()
+    added = set()
+    for key, value in config.items():
+        if key.startswith(prefix + 'ADDED'):
+            added.add(value['generation'])
+        else:
+            generations.add(value['generation'])
+    if len(generations) != 1:
+        return 'generations {0}'.format(sorted(generations))
+    generation = generations.pop()
+    if added != set(range(1, generation + 1)):
+        return 'generation {0} with {1} added keys'.format(
+            generation, len(added),
+        )
+
+
+class Writer(object):
+    """Reload the config with a new generation until stopped."""
+
+    def __init__(self, config, size, stop):
+        self.config = config
+        self.size = size
+        self.stop = stop
+        self.reloads = 0
+        self.latencies = []
+        self.errors = []
+
+    def run(self):
+        """Reload repeatedly, recording any exception as an error."""
+        try:
+            self.reload()
+        except Exception as err:
+            self.errors.append('writer raised {0!r}'.format(err))
+
+    def reload(self):
+        """Reload repeatedly."""
+        generation = 0
+        while not self.stop.is_set():
+            generation += 1
+            data = generate(self.size, generation)
+            start = timer()
+            self.config.update_from_json_file(io.StringIO(data))
+            self.latencies.append(timer() - start)
+            self.reloads += 1
+
+
+class Reader(object):
+    """Read the config in various ways until stopped, checking each read."""
+
+    def __init__(self, config, size, stop):
+        self.config = config
+        self.keys = [
+            '{0}_KEY{1}'.format('APP' if i % 2 else 'LIB', i)
+            for i in range(size)
+        ]
+        self.stop = stop
+        self.seen_generation = 0
+        self.latencies = dict(
+            (kind, []) for kind in ('item', 'attribute', 'namespace',
+                                    'snapshot')
+        )
+        self.errors = []
+
+    def run(self):
+        """Read repeatedly, recording any exception as an error."""
+        try:
+            self.read()
+        except Exception as err:
+            self.errors.append('reader raised {0!r}'.format(err))
+
+    def read(self):
+        """Read repeatedly."""
+        config = self.config
+        keys = self.keys
+        latencies = self.latencies
+        use_attributes = configloader.DictType is not dict
+        last_version = 0
+        count = 0
+        while not self.stop.is_set():
+            count += 1
+            key = random.choice(keys)
+
+            start = timer()
+            value = config[key]
+            latencies['item'].append(timer() - start)
+            self.check_value(key, value)
+
+            if use_attributes:
+                start = timer()
+                value = getattr(config, key)
+                latencies['attribute'].append(timer() - start)
+                self.check_value(key, value)
+
+            if count % NAMESPACE_INTERVAL == 0:
+                start = timer()
+                namespace = config.namespace('APP')
+                latencies['namespace'].append(timer() - start)
+                error = check_consistent(namespace)
+                if error:
+                    self.errors.append('torn namespace: {0}'.format(error))
+
+            if count % SNAPSHOT_INTERVAL == 0:
+                start = timer()
+                snapshot = config.snapshot()
+                latencies['snapshot'].append(timer() - start)
+                error = check_consistent(snapshot, 'APP_')
+                if error:
+                    self.errors.append('torn snapshot: {0}'.format(error))
+                if snapshot.version < last_version:
+                    self.errors.append('version went from {0} to {1}'.format(
+                        last_version, snapshot.version,
+                    ))
+                last_version = snapshot.version
+
+    def check_value(self, key, value):
+        """Check that a single read doesn't go back to an older generation."""
+        generation = value['generation']
+        if generation < self.seen_generation:
+            self.errors.append(
+                '{0} went back from generation {1} to {2}'.format(
+                    key, self.seen_generation, generation,
+                )
+            )
+        self.seen_generation = generation
+
+
+def report(args, writer, readers):
+    """Print throughput, latency and memory figures."""
+    print('Config size: {0} keys; {1} reader threads; {2}s'.format(
+        args.size, args.readers, args.duration,
+    ))
+    print('Reloads: {0} ({1:.1f}/s), p50 {2}, p99 {3}'.format(
+        writer.reloads,
+        writer.reloads / args.duration,
+        format_latency(percentile(writer.latencies, 50)),
+        format_latency(percentile(writer.latencies, 99)),
+    ))
+    for kind in sorted(readers[0].latencies if readers else ()):
+        latencies = [
+            latency for reader in readers for latency in reader.latencies[kind]
+        ]
+        if not latencies:
+            continue
+        print('{0:>9} reads: {1} ({2:.0f}/s), p50 {3}, p99 {4}'.format(
+            kind,
+            len(latencies),
+            len(latencies) / args.duration,
+            format_latency(percentile(latencies, 50)),
+            format_latency(percentile(latencies, 99)),
+        ))
+    if args.trace_memory:
+        print('Peak traced memory: {0:.1f} MiB'.format(
+            tracemalloc.get_traced_memory()[1] / 2 ** 20,
+        ))
+    elif resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak *= 1024  # Reported in kilobytes
+        print('Peak resident memory: {0:.1f} MiB'.format(peak / 2 ** 20))
+
+
+def percentile(values, percent):
+    """Return the given percentile of a list of numbers."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+def format_latency(seconds):
+    """Format a latency in microseconds or milliseconds."""
+    if seconds is None:
+        return '-'
+    if seconds < 0.001:
+        return '{0:.1f}us'.format(seconds * 1e6)
+    return '{0:.2f}ms'.format(seconds * 1e3)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,9 +6,32 @@ __email__ = 'adblair@gmail.com'
 __version__ = '1.0.2.dev0'
 
 
+import array
+import collections
+import copy
+import functools
+import hashlib
+import io
 import json
 import logging
 import os
+import socket
+import sys
+import threading
+import time
+import types
+import weakref
+
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+try:
+    import http.client as httplib
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urljoin, urlsplit
 
 try:
     import attrdict
@@ -18,6 +41,13 @@ try:
     import yaml
 except ImportError:
     pass
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        pass
 
 try:
     DictType = attrdict.AttrDict
@@ -30,8 +60,36 @@ try:
 except NameError:
     basestring = str
 
+# Only native strings can be interned on Python 2
+try:
+    _intern = sys.intern
+except AttributeError:
+    _intern = intern  # noqa: F821
+
 log = logging.getLogger(__name__)
 
+#: Version of the file format written by :meth:`ConfigLoader.dump`
+SNAPSHOT_VERSION = 1
+
+# Held while changing any ConfigLoader, so each change gets its own version
+_write_lock = threading.RLock()
+
+# Marks arguments that weren't given
+_missing = object()
+
+# Settings extracted by ConfigLoader.update_from_object(..., cache=True)
+_object_cache = weakref.WeakKeyDictionary()
+
+# Last response fetched by ConfigLoader.update_from_url, keyed by URL
+_url_cache = {}
+
+# YAML loader supporting !secret tags, created when first needed
+_SecretLoader = None
+
+# Idle keep-alive connections, keyed by (scheme, netloc)
+_connections = {}
+_connections_lock = threading.Lock()
+
 
 class ConfigLoader(DictType):
     """
@@ -43,7 +101,13 @@ class ConfigLoader(DictType):
     .. _AttrDict: https://github.com/bcj/AttrDict
     """
 
-    def update_from_object(self, obj, criterion=lambda key: key.isupper()):
+    # Incremented whenever the top-level keys are changed
+    _version = 0
+
+    # Descriptions of the sources loaded by the update_from_* methods
+    _sources = ()
+
+    def update_from_object(self, obj, criterion=None, cache=False):
         """
         Update dict from the attributes of a module, class or other object.
 
@@ -57,7 +121,18 @@ class ConfigLoader(DictType):
             of an attribute, if that attribute is to be used.
         :type criterion: :py:class:`function`
 
+        :arg cache: If True, and no ``criterion`` is given, remember the
+            extracted settings for ``obj`` and reuse them on later calls,
+            until the module is reloaded or
+            :meth:`~ConfigLoader.clear_object_cache` is called. Classes and
+            other objects are only invalidated by
+            :meth:`~ConfigLoader.clear_object_cache`. Ignored when a
+            ``criterion`` is given.
+
         .. versionadded:: 1.0
+
+        .. versionchanged:: 1.1
+            Added the ``cache`` argument.
         """
         log.debug('Loading config from {0}'.format(obj))
         if isinstance(obj, basestring):
@@ -67,12 +142,30 @@ class ConfigLoader(DictType):
                 obj = getattr(mod, name)
             else:
                 obj = __import__(obj, globals(), locals(), [], 0)
-        self.update(
-            (key, getattr(obj, key))
-            for key in filter(criterion, dir(obj))
-        )
+        if cache and criterion is None:
+            self.update(_get_cached_settings(obj))
+        else:
+            self.update(_extract_settings(obj, criterion))
+        self._add_source('object:{0}'.format(
+            getattr(obj, '__name__', None) or repr(obj)
+        ))
+
+    @staticmethod
+    def clear_object_cache(obj=None):
+        """
+        Forget settings cached by :meth:`~ConfigLoader.update_from_object`.
+
+        :arg obj: Object whose cached settings should be discarded. If not
+            given, the whole cache is cleared.
+
+        .. versionadded:: 1.1
+        """
+        if obj is None:
+            _object_cache.clear()
+        else:
+            _object_cache.pop(obj, None)
 
-    def update_from_yaml_env(self, env_var):
+    def update_from_yaml_env(self, env_var, secret_resolver=None):
         """
         Update dict from the YAML file specified in an environment variable.
 
@@ -81,23 +174,50 @@ class ConfigLoader(DictType):
         :arg env_var: Environment variable name.
         :type env_var: :py:class:`str`
 
+        :arg secret_resolver: Resolver for ``!secret`` references, as
+            described in :meth:`~ConfigLoader.update_from_yaml_file`.
+
         .. _PyYAML: http://pyyaml.org/wiki/PyYAML
+
+        .. versionchanged:: 1.1
+            Added the ``secret_resolver`` argument.
         """
-        _check_yaml_module()
-        return self._update_from_env(env_var, yaml.safe_load)
+        return self._update_from_env(
+            env_var, _get_loader('yaml', secret_resolver),
+        )
 
-    def update_from_yaml_file(self, file_path_or_obj):
+    def update_from_yaml_file(self, file_path_or_obj, secret_resolver=None):
         """
         Update dict from a YAML file.
 
         The `PyYAML`_ package must be installed before this method can be used.
 
+        If a ``secret_resolver`` is given, the file may contain references to
+        secrets kept elsewhere, e.g. in a vault::
+
+            DB_PASSWORD: !secret db/password
+
+        All the references in the file are collected first, and then passed
+        together to a single call of ``secret_resolver``, which must return a
+        dict mapping each reference to its value. Resolvers that talk to a
+        remote service can therefore fetch every secret in one batch; wrap
+        them in a :class:`SecretCache` to avoid fetching the same secrets
+        again on every load. String values are stored as :class:`Secret`
+        objects, so they are masked when the config is printed.
+
         :arg file_path_or_obj: Filepath or file-like object.
 
+        :arg secret_resolver: Callable taking a list of secret references and
+            returning a dict of their values.
+
         .. _PyYAML: http://pyyaml.org/wiki/PyYAML
+
+        .. versionchanged:: 1.1
+            Added the ``secret_resolver`` argument.
         """
-        _check_yaml_module()
-        return self._update_from_file(file_path_or_obj, yaml.safe_load)
+        return self._update_from_file(
+            file_path_or_obj, _get_loader('yaml', secret_resolver),
+        )
 
     def update_from_json_env(self, env_var):
         """
@@ -106,7 +226,7 @@ class ConfigLoader(DictType):
         :arg env_var: Environment variable name.
         :type env_var: :py:class:`str`
         """
-        return self._update_from_env(env_var, json.load)
+        return self._update_from_env(env_var, _get_loader('json'))
 
     def update_from_json_file(self, file_path_or_obj):
         """
@@ -114,7 +234,142 @@ class ConfigLoader(DictType):
 
         :arg file_path_or_obj: Filepath or file-like object.
         """
-        return self._update_from_file(file_path_or_obj, json.load)
+        return self._update_from_file(file_path_or_obj, _get_loader('json'))
+
+    def update_from_toml_env(self, env_var):
+        """
+        Update dict from the TOML file specified in an environment variable.
+
+        Uses the standard library's :py:mod:`tomllib` module on Python 3.11+.
+        On earlier versions the `tomli`_ package must be installed before
+        this method can be used.
+
+        :arg env_var: Environment variable name.
+        :type env_var: :py:class:`str`
+
+        .. _tomli: https://github.com/hukkin/tomli
+
+        .. versionadded:: 1.1
+        """
+        return self._update_from_env(env_var, _get_loader('toml'))
+
+    def update_from_toml_file(self, file_path_or_obj):
+        """
+        Update dict from a TOML file.
+
+        Uses the standard library's :py:mod:`tomllib` module on Python 3.11+.
+        On earlier versions the `tomli`_ package must be installed before
+        this method can be used.
+
+        :arg file_path_or_obj: Filepath or file-like object.
+
+        .. _tomli: https://github.com/hukkin/tomli
+
+        .. versionadded:: 1.1
+        """
+        return self._update_from_file(file_path_or_obj, _get_loader('toml'))
+
+    def update_from_dotenv_env(self, env_var):
+        """
+        Update dict from the dotenv file specified in an environment variable.
+
+        See :meth:`~ConfigLoader.update_from_dotenv_file` for the supported
+        syntax.
+
+        :arg env_var: Environment variable name.
+        :type env_var: :py:class:`str`
+
+        .. versionadded:: 1.1
+        """
+        return self._update_from_env(env_var, _get_loader('dotenv'))
+
+    def update_from_dotenv_file(self, file_path_or_obj):
+        r"""
+        Update dict from a dotenv (``.env``) file.
+
+        Each line holds a ``KEY=value`` pair, optionally preceded by
+        ``export``. Values may be enclosed in single quotes, which are taken
+        literally, or double quotes, in which ``\n``, ``\t``, ``\"``
+        and ``\\`` escapes are recognised. Unquoted values end at a ``#``
+        that follows a space. Blank lines and lines starting with ``#`` are
+        ignored. All values are loaded as strings.
+
+        :arg file_path_or_obj: Filepath or file-like object.
+
+        .. versionadded:: 1.1
+        """
+        return self._update_from_file(
+            file_path_or_obj, _get_loader('dotenv'),
+        )
+
+    def update_from_ini_env(self, env_var):
+        """
+        Update dict from the INI file specified in an environment variable.
+
+        See :meth:`~ConfigLoader.update_from_ini_file` for how the file is
+        loaded.
+
+        :arg env_var: Environment variable name.
+        :type env_var: :py:class:`str`
+
+        .. versionadded:: 1.1
+        """
+        return self._update_from_env(env_var, _get_loader('ini'))
+
+    def update_from_ini_file(self, file_path_or_obj):
+        """
+        Update dict from an INI file.
+
+        Each section becomes a dict of its options, so that::
+
+            [DB]
+            Host = localhost
+
+        is loaded as ``{'DB': {'Host': 'localhost'}}``. Options in the
+        ``[DEFAULT]`` section are included in every other section. The case
+        of option names is preserved, and values are loaded as strings
+        without interpolation.
+
+        :arg file_path_or_obj: Filepath or file-like object.
+
+        .. versionadded:: 1.1
+        """
+        return self._update_from_file(file_path_or_obj, _get_loader('ini'))
+
+    def update_from_url(self, url, format='json', cache_path=None, timeout=10):
+        """
+        Update dict from a config document served over HTTP(S).
+
+        Connections are kept alive and reused between calls. The ``ETag`` and
+        ``Last-Modified`` headers of each response are remembered, so
+        fetching an unchanged document again only costs a ``304 Not
+        Modified`` response.
+
+        If ``cache_path`` is given, the last document retrieved is also
+        saved there, and used instead when the server can't be reached or
+        responds with a server error.
+
+        A single redirect is followed; any other response besides ``200`` or
+        ``304`` raises :py:exc:`IOError`.
+
+        :arg url: URL of the document.
+        :type url: :py:class:`str`
+
+        :arg format: One of ``'json'``, ``'yaml'``, ``'toml'``, ``'ini'`` or
+            ``'dotenv'``.
+        :type format: :py:class:`str`
+
+        :arg cache_path: Path of a file in which to keep the last document.
+
+        :arg timeout: Connection timeout in seconds.
+
+        .. versionadded:: 1.1
+        """
+        loader = _get_loader(format)
+        log.debug('Loading config from {0}'.format(url))
+        body = _fetch_url(url, cache_path, timeout)
+        self.update(loader(io.StringIO(body)))
+        self._add_source('url:{0}'.format(url))
 
     def update_from_env_namespace(self, namespace):
         """
@@ -135,6 +390,67 @@ class ConfigLoader(DictType):
         :type env_var: :py:class:`str`
         """
         self.update(ConfigLoader(os.environ).namespace(namespace))
+        self._add_source('env:{0}_'.format(namespace.rstrip('_')))
+
+    def update_from_env_nested(self, namespace, delimiter='__'):
+        """
+        Update nested values from environment variables with a given prefix.
+
+        Variable names are split on ``delimiter`` into a path of keys, so
+        that nested config can be overridden. For example, if the following
+        environment variables were set::
+
+            MY_APP__DB__POOL__SIZE=20
+            MY_APP__DB__HOST=db.example.com
+
+        Then calling ``.update_from_env_nested('MY_APP')`` would set
+        ``config['DB']['POOL']['SIZE']`` and ``config['DB']['HOST']``, leaving
+        any other keys under ``config['DB']`` untouched.
+
+        Each key is matched case-insensitively against the existing keys at
+        its level, so ``MY_APP__DB__HOST`` will override ``config['db']
+        ['host']``. Values are converted to the type of the value they
+        replace: ``bool``, ``int`` and ``float`` values are parsed, and lists
+        and dicts are parsed as JSON. New keys keep their string values.
+
+        Items of existing lists can be overridden by their index, e.g.
+        ``MY_APP__HOSTS__0``. Overriding keys inside any other existing
+        value, or list items that don't exist, raises :py:exc:`ValueError`.
+
+        Nested dicts and lists are copied rather than modified in place, and
+        all the variables are applied in a single :meth:`update`.
+
+        :arg namespace: Common environment variable prefix.
+        :type namespace: :py:class:`str`
+
+        :arg delimiter: Separator between the keys in each variable name.
+        :type delimiter: :py:class:`str`
+
+        .. versionadded:: 1.1
+        """
+        prefix = namespace.rstrip('_') + delimiter
+        overrides = {}
+        for name in sorted(os.environ):
+            if not name.startswith(prefix):
+                continue
+            path = name[len(prefix):].split(delimiter)
+            if not all(path):
+                log.debug('Ignoring environment variable {0}'.format(name))
+                continue
+            node = overrides
+            for key in path[:-1]:
+                child = node.get(key)
+                if not isinstance(child, dict):
+                    # A nested variable wins over a less nested one
+                    child = node[key] = {}
+                node = child
+            if not isinstance(node.get(path[-1]), dict):
+                node[path[-1]] = (name, os.environ[name])
+        with _write_lock:
+            self.update(
+                _merge_env_overrides(self, overrides, changes_only=True)
+            )
+        self._add_source('env:{0}'.format(prefix))
 
     def update_from(
             self,
@@ -201,12 +517,181 @@ class ConfigLoader(DictType):
         :rtype: :class:`ConfigLoader`
         """
         namespace = namespace.rstrip('_') + '_'
-        return ConfigLoader(
+        # Filter a copy, so that a concurrent update is either seen in full
+        # or not at all
+        items = dict.copy(self)
+        return type(self)(
             (key_transform(key[len(namespace):]), value)
-            for key, value in self.items()
+            for key, value in items.items()
             if key[:len(namespace)] == namespace
         )
 
+    def get_path(self, path, default=_missing):
+        """
+        Return a nested value, given the path of keys leading to it.
+
+        The path can either be a sequence of keys, or a string of keys
+        separated by dots. Example::
+
+            >>> from configloader import ConfigLoader
+            >>> config = ConfigLoader(DB={'POOL': {'SIZE': 5}}, HOSTS=['a'])
+            >>> config.get_path('DB.POOL.SIZE')
+            5
+            >>> config.get_path('HOSTS.0')
+            'a'
+            >>> config.get_path('DB.POOL.TIMEOUT', default=10)
+            10
+
+        Items of lists and tuples are looked up by their index.
+
+        :arg path: Sequence of keys, or dot-separated string of keys.
+        :arg default: Value to return if the path doesn't exist. If not
+            given, :py:exc:`KeyError` is raised instead.
+
+        .. versionadded:: 1.1
+        """
+        keys = _split_path(path)
+        try:
+            return _get_path(self, keys)
+        except (KeyError, IndexError, TypeError, ValueError):
+            if default is _missing:
+                raise KeyError(path)
+            return default
+
+    def accessor(self, path, default=_missing):
+        """
+        Return a function that looks up a nested value.
+
+        This is equivalent to ``lambda: config.get_path(path, default)``,
+        except that the value is looked up only once, and then reused until
+        the config is next changed. Use it to read the same value
+        repeatedly, e.g. in request handlers::
+
+            >>> from configloader import ConfigLoader
+            >>> config = ConfigLoader(DB={'POOL': {'SIZE': 5}})
+            >>> pool_size = config.accessor('DB.POOL.SIZE')
+            >>> pool_size()
+            5
+            >>> config.update(DB={'POOL': {'SIZE': 10}})
+            >>> pool_size()
+            10
+
+        Only changes made through the :class:`ConfigLoader` itself are
+        noticed; modifying a nested dict in place will not refresh the value.
+
+        :arg path: Sequence of keys, or dot-separated string of keys.
+        :arg default: Value to return if the path doesn't exist.
+
+        :return: Function taking no arguments.
+
+        .. versionadded:: 1.1
+        """
+        return _Accessor(self, path, default)
+
+    @property
+    def version(self):
+        """
+        Number that increases every time the config is changed.
+
+        Compare it with a previously seen value to find out cheaply whether
+        anything derived from the config is out of date. Only changes made
+        through the :class:`ConfigLoader` itself are counted, not changes
+        made in place to nested dicts or lists.
+
+        .. versionadded:: 1.1
+        """
+        return self._version
+
+    def snapshot(self):
+        """
+        Return a consistent copy of the config, as of a single version.
+
+        Each of the :meth:`~ConfigLoader.update_from_*` methods loads its
+        source completely before merging it into the config in a single
+        step, so a single lookup, or a call to :meth:`namespace`, never sees
+        a partly applied update. Iterating over the config directly can, so
+        use this method when several values need to be read from the same
+        version of the config while other threads may be updating it. The
+        copy is shallow, and its :attr:`version` matches the original's.
+
+        :return: New config dict.
+        :rtype: :class:`ConfigLoader`
+
+        .. versionadded:: 1.1
+        """
+        while True:
+            version = self._version
+            items = dict.copy(self)
+            if version == self._version:
+                break
+        config = type(self)(items)
+        object.__setattr__(config, '_version', version)
+        object.__setattr__(config, '_sources', self._sources)
+        return config
+
+    @property
+    def sources(self):
+        """
+        List of the sources loaded so far, in the order they were loaded.
+
+        Each source loaded by one of the :meth:`~ConfigLoader.update_from_*`
+        methods is described by a string such as
+        ``'object:my_app.settings'``, ``'file:/etc/my_app.yaml'``,
+        ``'url:https://config.example.com/my_app.json'`` or
+        ``'env:MY_APP_'``.
+
+        .. versionadded:: 1.1
+        """
+        return list(self._sources)
+
+    def dump(self, path, format='json'):
+        """
+        Save the config to a snapshot file.
+
+        The snapshot holds the config together with a format version, a
+        checksum and the list of :attr:`~ConfigLoader.sources` it was loaded
+        from. Load it with :meth:`~ConfigLoader.load_snapshot`, e.g. to
+        merge config from several sources once at deploy time, and then
+        read just the one file in each worker process.
+
+        Values must be representable in the chosen format, or
+        :py:exc:`ValueError` is raised. Secrets are written in plain text.
+
+        :arg path: Path of the file to write.
+        :arg format: Either ``'json'`` (the fastest to load) or ``'yaml'``.
+
+        .. versionadded:: 1.1
+        """
+        config = _plain(self)
+        snapshot = {
+            'configloader_snapshot': SNAPSHOT_VERSION,
+            'checksum': _checksum(config, format),
+            'sources': self.sources,
+            'config': config,
+        }
+        _write_file(path, _serialize(snapshot, format))
+
+    @classmethod
+    def load_snapshot(cls, path, format='json'):
+        """
+        Load a config from a snapshot file written by :meth:`dump`.
+
+        :arg path: Path of the snapshot file.
+        :arg format: Format the snapshot was written in.
+
+        :raises ValueError: If the file isn't a snapshot, was written by an
+            incompatible version, or its checksum doesn't match its content.
+
+        :return: New config dict.
+        :rtype: :class:`ConfigLoader`
+
+        .. versionadded:: 1.1
+        """
+        snapshot = read_snapshot(path, format)
+        config = cls(snapshot['config'])
+        object.__setattr__(config, '_sources', tuple(snapshot['sources']))
+        return config
+
     def namespace_lower(self, namespace):
         """
         Return a copy with only the keys from a given namespace, lower-cased.
@@ -235,6 +720,33 @@ class ConfigLoader(DictType):
         """
         return self.namespace(namespace, key_transform=lambda key: key.lower())
 
+    def compact(self, arrays=False):
+        """
+        Reduce the memory used by the loaded config, in place.
+
+        Keys and string values are interned, recursively through nested
+        dicts and lists, so that strings repeated across a large config are
+        only stored once. Values added later are not compacted; use
+        :class:`CompactConfigLoader` to compact everything as it is loaded.
+
+        The config is briefly empty while it is compacted, so do this before
+        sharing it with other threads.
+
+        :arg arrays: If True, lists made up entirely of ints or entirely of
+            floats are also converted to :py:class:`array.array` objects.
+            Arrays are much smaller than lists, but do not compare equal to
+            them.
+
+        .. versionadded:: 1.1
+        """
+        items = [
+            (_compact(key), _compact(value, arrays))
+            for key, value in self.items()
+        ]
+        with _write_lock:
+            self.clear()
+            self.update(items)
+
     def _update_from_env(self, env_var, loader):
         if env_var in os.environ:
             self._update_from_file_path(os.environ[env_var], loader)
@@ -262,15 +774,690 @@ class ConfigLoader(DictType):
 
     def _update_from_file_obj(self, file_obj, loader):
         if hasattr(file_obj, 'name') and isinstance(file_obj.name, basestring):
-            log.debug('Loading config from {0}'.format(
-                os.path.abspath(file_obj.name)
-            ))
+            source = os.path.abspath(file_obj.name)
+            log.debug('Loading config from {0}'.format(source))
+        else:
+            source = '<stream>'
         self.update(loader(file_obj))
+        self._add_source('file:{0}'.format(source))
+
+    def _add_source(self, source):
+        with _write_lock:
+            object.__setattr__(self, '_sources', self._sources + (source,))
 
     def __repr__(self):
         """Represent as a string."""
         return '{0}({1})'.format(type(self).__name__, dict.__repr__(self))
 
+    def __setitem__(self, key, value):
+        """Set an item."""
+        with _write_lock:
+            super(ConfigLoader, self).__setitem__(key, value)
+            self._bump_version()
+
+    def __delitem__(self, key):
+        """Delete an item."""
+        with _write_lock:
+            super(ConfigLoader, self).__delitem__(key)
+            self._bump_version()
+
+    def clear(self):
+        """Remove all items."""
+        with _write_lock:
+            super(ConfigLoader, self).clear()
+            self._bump_version()
+
+    def pop(self, *args):
+        """Remove an item and return its value."""
+        with _write_lock:
+            value = super(ConfigLoader, self).pop(*args)
+            self._bump_version()
+        return value
+
+    def popitem(self):
+        """Remove an arbitrary item and return it."""
+        with _write_lock:
+            item = super(ConfigLoader, self).popitem()
+            self._bump_version()
+        return item
+
+    def setdefault(self, key, default=None):
+        """Return the value of an item, first setting it if missing."""
+        with _write_lock:
+            value = super(ConfigLoader, self).setdefault(key, default)
+            self._bump_version()
+        return value
+
+    def update(self, *args, **kwargs):
+        """
+        Update from a dict or iterable of pairs, and keyword arguments.
+
+        All the new items are collected into a dict first, which is then
+        merged in a single step, so that other threads see either none or
+        all of them.
+        """
+        if kwargs or len(args) != 1 or type(args[0]) is not dict:
+            changes = dict(*args, **kwargs)
+        else:
+            changes = args[0]
+        with _write_lock:
+            super(ConfigLoader, self).update(changes)
+            self._bump_version()
+
+    def __ior__(self, other):
+        """Update in place with the ``|=`` operator."""
+        self.update(other)
+        return self
+
+    def _bump_version(self):
+        # AttrDict doesn't allow attributes to be assigned normally
+        object.__setattr__(self, '_version', self._version + 1)
+
+
+def _extract_settings(obj, criterion):
+    namespace = getattr(obj, '__dict__', None)
+    if isinstance(obj, types.ModuleType) and '__dir__' not in namespace:
+        # A module's attributes are exactly its namespace, so skip dir()
+        items = namespace.items()
+        if criterion is None:
+            return [(key, value) for key, value in items if key.isupper()]
+        return [(key, value) for key, value in items if criterion(key)]
+    if criterion is None:
+        keys = [key for key in dir(obj) if key.isupper()]
+    else:
+        keys = filter(criterion, dir(obj))
+    return [(key, getattr(obj, key)) for key in keys]
+
+
+def _get_cached_settings(obj):
+    # A reloaded module gets a new __spec__, which invalidates its entry
+    generation = getattr(obj, '__spec__', None)
+    try:
+        entry = _object_cache.get(obj)
+    except TypeError:
+        # Object can't be weakly referenced
+        return _extract_settings(obj, None)
+    if entry is None or entry[0] is not generation:
+        entry = _object_cache[obj] = (
+            generation, _extract_settings(obj, None),
+        )
+    return entry[1]
+
+
+def _split_path(path):
+    if isinstance(path, basestring):
+        return tuple(path.split('.'))
+    return tuple(path)
+
+
+def _get_path(value, keys):
+    for key in keys:
+        if isinstance(value, (list, tuple)):
+            value = value[int(key)]
+        else:
+            value = dict.__getitem__(value, key)
+    return value
+
+
+def read_snapshot(path, format='json'):
+    """
+    Read and verify a snapshot file written by :meth:`ConfigLoader.dump`.
+
+    :arg path: Path of the snapshot file.
+    :arg format: Format the snapshot was written in.
+
+    :raises ValueError: If the file isn't a snapshot, was written by an
+        incompatible version, or its checksum doesn't match its content.
+
+    :return: The snapshot's ``configloader_snapshot`` version, ``checksum``,
+        ``sources`` and ``config``.
+    :rtype: :py:class:`dict`
+
+    .. versionadded:: 1.1
+    """
+    with io.open(path, encoding='utf-8') as file_obj:
+        snapshot = _get_loader(format)(file_obj)
+    if not isinstance(snapshot, dict) or \
+            'configloader_snapshot' not in snapshot:
+        raise ValueError('{0} is not a config snapshot'.format(path))
+    if snapshot['configloader_snapshot'] != SNAPSHOT_VERSION:
+        raise ValueError('{0} has unsupported snapshot version {1}'.format(
+            path, snapshot['configloader_snapshot'],
+        ))
+    if _checksum(snapshot['config'], format) != snapshot['checksum']:
+        raise ValueError('{0} failed checksum verification'.format(path))
+    return snapshot
+
+
+def _plain(value):
+    if isinstance(value, dict):
+        return dict(
+            (_plain(key), _plain(item)) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple, array.array)):
+        return [_plain(item) for item in value]
+    if isinstance(value, basestring) and type(value) not in (str, type(u'')):
+        return type(u'')(value)
+    return value
+
+
+def _checksum(config, format):
+    data = _serialize(config, format, compact=True)
+    return 'sha256:' + hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _serialize(value, format, compact=False):
+    try:
+        if format == 'json':
+            return json.dumps(
+                value,
+                ensure_ascii=False,
+                sort_keys=True,
+                separators=(',', ':') if compact else None,
+            )
+        if format == 'yaml':
+            _check_yaml_module()
+            try:
+                return yaml.safe_dump(
+                    value, allow_unicode=True, default_flow_style=False,
+                )
+            except yaml.YAMLError as err:
+                raise TypeError(err)
+    except TypeError as err:
+        raise ValueError(
+            'Config cannot be written as {0}: {1}'.format(format, err)
+        )
+    raise ValueError('Unsupported format: {0!r}'.format(format))
+
+
+def _write_file(path, text):
+    # Write to a temporary file first, so readers never see a partial file
+    temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with io.open(temp_path, 'w', encoding='utf-8') as file_obj:
+            file_obj.write(type(u'')(text))
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _merge_env_overrides(existing, overrides, path=(), changes_only=False):
+    if existing is None:
+        existing = {}
+    if isinstance(existing, list):
+        return _merge_env_list_overrides(existing, overrides, path)
+    if not isinstance(existing, dict):
+        raise ValueError(
+            'Could not override keys of {0}: existing value is a {1}, not '
+            'a dict'.format('.'.join(path), type(existing).__name__)
+        )
+    merged = {} if changes_only else copy.copy(existing)
+    index = dict(
+        (key.lower(), key) for key in existing if isinstance(key, basestring)
+    )
+    for override_key, value in overrides.items():
+        key = override_key
+        if key not in existing:
+            key = index.get(key.lower(), key)
+        merged[key] = _merge_env_override(existing.get(key), value, path, key)
+    return merged
+
+
+def _merge_env_list_overrides(existing, overrides, path):
+    merged = list(existing)
+    for override_key, value in overrides.items():
+        try:
+            index = int(override_key)
+            if index < 0:
+                raise IndexError(index)
+            current = merged[index]
+        except (ValueError, IndexError):
+            raise ValueError(
+                'Could not override {0}: no item {1} in list of {2}'.format(
+                    '.'.join(path), override_key, len(merged),
+                )
+            )
+        merged[index] = _merge_env_override(current, value, path, index)
+    return merged
+
+
+def _merge_env_override(current, value, path, key):
+    if isinstance(value, dict):
+        return _merge_env_overrides(current, value, path + (str(key),))
+    return _coerce_env_value(value[0], value[1], current)
+
+
+def _coerce_env_value(name, value, current):
+    try:
+        if isinstance(current, bool):
+            if value.lower() in ('1', 'true', 'yes', 'on'):
+                return True
+            if value.lower() in ('0', 'false', 'no', 'off', ''):
+                return False
+            raise ValueError('not a boolean')
+        if isinstance(current, int):
+            return int(value)
+        if isinstance(current, float):
+            return float(value)
+        if isinstance(current, (list, dict)):
+            return json.loads(value)
+    except ValueError as err:
+        raise ValueError(
+            'Could not convert environment variable {0}={1!r} to {2}: '
+            '{3}'.format(name, value, type(current).__name__, err)
+        )
+    return value
+
+
+def _fetch_url(url, cache_path, timeout):
+    cached = _url_cache.get(url)
+    if cached is None and cache_path and os.path.exists(cache_path):
+        with io.open(cache_path, encoding='utf-8') as cache_file:
+            cached = _url_cache[url] = json.load(cache_file)
+    headers = {}
+    if cached is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    try:
+        status, response, body = _request(url, headers, timeout)
+        location = response.getheader('Location')
+        if status in (301, 302, 303, 307, 308) and location:
+            # Follow a single redirect only
+            status, response, body = _request(
+                urljoin(url, location), headers, timeout,
+            )
+    except (httplib.HTTPException, socket.error) as err:
+        if cached is None:
+            raise
+        log.warning('Using cached config for {0}; {1}'.format(url, err))
+        return cached['body']
+    if status == 304 and cached is not None:
+        return cached['body']
+    if status >= 500 and cached is not None:
+        log.warning('Using cached config for {0}; HTTP {1}'.format(
+            url, status,
+        ))
+        return cached['body']
+    if status != 200:
+        raise IOError('Could not load config from {0}; HTTP {1}'.format(
+            url, status,
+        ))
+    cached = _url_cache[url] = {
+        'etag': response.getheader('ETag'),
+        'last_modified': response.getheader('Last-Modified'),
+        'body': body.decode('utf-8'),
+    }
+    if cache_path:
+        _write_file(cache_path, json.dumps(cached, ensure_ascii=False))
+    return cached['body']
+
+
+def _close_connections():
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for conn in connections:
+        conn.close()
+
+
+def _request(url, headers, timeout):
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    with _connections_lock:
+        conn = _connections.pop(key, None)
+    reused = conn is not None
+    while True:
+        if conn is None:
+            if parts.scheme == 'https':
+                conn = httplib.HTTPSConnection(parts.netloc, timeout=timeout)
+            else:
+                conn = httplib.HTTPConnection(parts.netloc, timeout=timeout)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if not reused:
+                raise
+            # The server may have closed an idle connection; try a new one
+            conn = None
+            reused = False
+        else:
+            break
+    if not response.will_close:
+        with _connections_lock:
+            if key not in _connections:
+                _connections[key], conn = conn, None
+    if conn is not None:
+        conn.close()
+    return response.status, response, body
+
+
+class _Accessor(object):
+
+    __slots__ = ('config', 'path', 'keys', 'default', 'version', 'value')
+
+    def __init__(self, config, path, default):
+        self.config = config
+        self.path = path
+        self.keys = _split_path(path)
+        self.default = default
+        self.version = None
+
+    def __call__(self):
+        if self.version != self.config._version:
+            version = self.config._version
+            try:
+                self.value = _get_path(self.config, self.keys)
+            except (KeyError, IndexError, TypeError, ValueError):
+                if self.default is _missing:
+                    raise KeyError(self.path)
+                self.value = self.default
+            self.version = version
+        return self.value
+
+
+class Secret(type(u'')):
+    """
+    A string holding a secret, which is masked in its :func:`repr`.
+
+    Values resolved from ``!secret`` references are stored as instances of
+    this class, so that they don't show up in logs or tracebacks when the
+    config is printed. They otherwise behave exactly like ordinary strings.
+
+    .. versionadded:: 1.1
+    """
+
+    def __repr__(self):
+        """Represent as a masked string."""
+        return "'********'"
+
+
+class SecretCache(object):
+    """
+    Cache the values returned by a secret resolver.
+
+    Wraps a resolver passed to :meth:`ConfigLoader.update_from_yaml_file`,
+    so that only references that aren't already cached are passed on, in a
+    single batch. Values expire after ``ttl`` seconds, and the least
+    recently used values are evicted when more than ``maxsize`` are cached.
+
+    :arg resolver: Callable taking a list of secret references and returning
+        a dict of their values.
+
+    :arg ttl: Number of seconds for which to keep each value.
+
+    :arg maxsize: Maximum number of values to keep.
+
+    .. versionadded:: 1.1
+    """
+
+    def __init__(self, resolver, ttl=300, maxsize=1024):
+        """Initialise the cache."""
+        self.resolver = resolver
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._values = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, refs):
+        """Return a dict of values for the given secret references."""
+        now = time.time()
+        values = {}
+        with self._lock:
+            for ref in refs:
+                entry = self._values.pop(ref, None)
+                if entry is not None and entry[0] > now:
+                    values[ref] = entry[1]
+                    self._values[ref] = entry
+        missing = [ref for ref in refs if ref not in values]
+        if missing:
+            resolved = self.resolver(missing)
+            values.update(resolved)
+            expires = now + self.ttl
+            with self._lock:
+                for ref in missing:
+                    if ref in resolved:
+                        self._values.pop(ref, None)
+                        self._values[ref] = (expires, resolved[ref])
+                while len(self._values) > self.maxsize:
+                    self._values.popitem(last=False)
+        return values
+
+    def clear(self):
+        """Discard all cached values."""
+        with self._lock:
+            self._values.clear()
+
+
+class CompactConfigLoader(ConfigLoader):
+    """
+    A :class:`ConfigLoader` that compacts values as they are loaded.
+
+    Everything passed through :meth:`update` (and therefore every
+    :meth:`~ConfigLoader.update_from_*` method) is compacted as described in
+    :meth:`~ConfigLoader.compact`, without converting lists to arrays. This
+    suits very large configs where the same keys and string values occur
+    many times. Only strings are deduplicated; other leaf values are stored
+    as loaded.
+
+    .. versionadded:: 1.1
+    """
+
+    def update(self, *args, **kwargs):
+        """Update dict, compacting the new keys and values."""
+        items = dict(*args, **kwargs)
+        super(CompactConfigLoader, self).update(
+            (_compact(key), _compact(value)) for key, value in items.items()
+        )
+
+
+def _compact(value, arrays=False):
+    # Subclasses of str, such as Secret, can't be interned
+    if type(value) is str:
+        return _intern(value)
+    if isinstance(value, dict):
+        items = [
+            (_compact(key), _compact(item, arrays))
+            for key, item in value.items()
+        ]
+        if type(value) is dict:
+            return dict(items)
+        # Copy other mappings, e.g. defaultdict, to keep their attributes
+        compacted = copy.copy(value)
+        compacted.clear()
+        compacted.update(items)
+        return compacted
+    if isinstance(value, list):
+        if arrays and value:
+            typecode = _array_typecode(value)
+            if typecode:
+                try:
+                    return array.array(typecode, value)
+                except OverflowError:
+                    pass
+        return [_compact(item, arrays) for item in value]
+    return value
+
+
+def _array_typecode(values):
+    types = set(map(type, values))
+    if types == set([int]):
+        return 'l'
+    if types == set([float]):
+        return 'd'
+
+
+class _SecretRef(object):
+
+    __slots__ = ('ref',)
+
+    def __init__(self, ref):
+        self.ref = ref
+
+
+def _get_loader(format, secret_resolver=None):
+    # Every source of config files goes through here to find its parser
+    if format == 'json':
+        return json.load
+    if format == 'yaml':
+        _check_yaml_module()
+        if secret_resolver is None:
+            return yaml.safe_load
+        return functools.partial(_load_yaml_secrets, resolver=secret_resolver)
+    if format == 'toml':
+        _check_toml_module()
+        return _load_toml
+    if format == 'ini':
+        return _load_ini
+    if format == 'dotenv':
+        return _load_dotenv
+    raise ValueError('Unsupported format: {0!r}'.format(format))
+
+
+def _load_toml(file_obj):
+    data = file_obj.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return tomllib.loads(data)
+
+
+def _load_ini(file_obj):
+    parser = configparser.RawConfigParser()
+    parser.optionxform = str
+    if hasattr(parser, 'read_file'):
+        parser.read_file(file_obj)
+    else:
+        parser.readfp(file_obj)
+    return dict(
+        (section, dict(parser.items(section)))
+        for section in parser.sections()
+    )
+
+
+_dotenv_escapes = {'n': '\n', 't': '\t', '"': '"', '\\': '\\'}
+
+
+def _load_dotenv(file_obj):
+    data = {}
+    for line_number, line in enumerate(file_obj, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('export '):
+            line = line[7:].lstrip()
+        key, sep, value = line.partition('=')
+        key = key.strip()
+        if not sep or not key:
+            raise ValueError(
+                'Invalid dotenv syntax on line {0}'.format(line_number)
+            )
+        value = value.strip()
+        quote = value[:1]
+        if quote in ('"', "'"):
+            end = value.find(quote, 1)
+            if quote == '"':
+                while end != -1 and _escaped(value, end):
+                    end = value.find(quote, end + 1)
+            if end == -1:
+                raise ValueError(
+                    'Unterminated quote on line {0}'.format(line_number)
+                )
+            value = value[1:end]
+            if quote == '"' and '\\' in value:
+                value = _unescape_dotenv(value)
+        else:
+            value = value.split(' #', 1)[0].rstrip()
+        data[key] = value
+    return data
+
+
+def _escaped(value, index):
+    backslashes = len(value[:index]) - len(value[:index].rstrip('\\'))
+    return backslashes % 2 == 1
+
+
+def _unescape_dotenv(value):
+    chars = []
+    index = 0
+    while index < len(value):
+        char = value[index]
+        if char == '\\' and index + 1 < len(value):
+            next_char = value[index + 1]
+            if next_char in _dotenv_escapes:
+                chars.append(_dotenv_escapes[next_char])
+                index += 2
+                continue
+        chars.append(char)
+        index += 1
+    return ''.join(chars)
+
+
+def _load_yaml_secrets(file_obj, resolver):
+    global _SecretLoader
+    if _SecretLoader is None:
+        class _SecretLoader(yaml.SafeLoader):
+            pass
+        _SecretLoader.add_constructor(
+            '!secret',
+            lambda loader, node: _SecretRef(loader.construct_scalar(node)),
+        )
+    data = yaml.load(file_obj, Loader=_SecretLoader)
+    refs = set()
+    _collect_secret_refs(data, refs)
+    if not refs:
+        return data
+    values = resolver(sorted(refs))
+    return _replace_secret_refs(data, values)
+
+
+def _collect_secret_refs(value, refs):
+    if isinstance(value, _SecretRef):
+        refs.add(value.ref)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_secret_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_secret_refs(item, refs)
+
+
+def _replace_secret_refs(value, values):
+    if isinstance(value, _SecretRef):
+        try:
+            secret = values[value.ref]
+        except KeyError:
+            raise KeyError('Secret not resolved: {0}'.format(value.ref))
+        if isinstance(secret, basestring):
+            return Secret(secret)
+        return secret
+    if isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = _replace_secret_refs(item, values)
+    elif isinstance(value, list):
+        value[:] = [_replace_secret_refs(item, values) for item in value]
+    return value
+
+
+def _check_toml_module():
+    if 'tomllib' not in globals():
+        err = ImportError(
+            'tomllib module not found; please install tomli in order to '
+            'enable configuration to be loaded from TOML files',
+        )
+        err.name = 'tomli'
+        err.path = __file__
+        raise err
+
 
 def _check_yaml_module():
     try:
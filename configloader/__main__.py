@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+r"""
+Command-line interface for building and inspecting config snapshots.
+
+Example::
+
+    python -m configloader build snapshot.json \
+        --obj my_app.settings --yaml-file config.yaml --env-namespace MY_APP
+    python -m configloader inspect snapshot.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+from configloader import ConfigLoader, read_snapshot
+
+
+def main(argv=None):
+    """Run the command-line interface."""
+    parser = argparse.ArgumentParser(prog='python -m configloader')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build = subparsers.add_parser(
+        'build',
+        help='merge config sources into a snapshot file',
+        description=(
+            'Merge config sources into a snapshot file. Sources are applied '
+            'in the order the options are listed below, as with '
+            'ConfigLoader.update_from.'
+        ),
+    )
+    build.add_argument('path', help='snapshot file to write')
+    build.add_argument('--format', default='json', choices=['json', 'yaml'])
+    build.add_argument('--obj', help='module or object, e.g. my_app.settings')
+    build.add_argument('--yaml-env', help='variable naming a YAML file')
+    build.add_argument('--yaml-file', help='YAML file')
+    build.add_argument('--json-env', help='variable naming a JSON file')
+    build.add_argument('--json-file', help='JSON file')
+    build.add_argument('--env-namespace', help='environment variable prefix')
+    build.set_defaults(func=_build)
+
+    inspect = subparsers.add_parser(
+        'inspect',
+        help='verify a snapshot file and describe its contents',
+    )
+    inspect.add_argument('path', help='snapshot file to read')
+    inspect.add_argument('--format', default='json', choices=['json', 'yaml'])
+    inspect.add_argument(
+        '--show', action='store_true', help='also print the config itself',
+    )
+    inspect.set_defaults(func=_inspect)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except (IOError, OSError, ImportError, ValueError) as err:
+        print('error: {0}'.format(err), file=sys.stderr)
+        return 1
+    return 0
+
+
+def _build(args):
+    config = ConfigLoader()
+    config.update_from(
+        obj=args.obj,
+        yaml_env=args.yaml_env,
+        yaml_file=args.yaml_file,
+        json_env=args.json_env,
+        json_file=args.json_file,
+        env_namespace=args.env_namespace,
+    )
+    config.dump(args.path, format=args.format)
+    print('Wrote {0} keys to {1}'.format(len(config), args.path))
+
+
+def _inspect(args):
+    snapshot = read_snapshot(args.path, format=args.format)
+    print('Snapshot version: {0}'.format(snapshot['configloader_snapshot']))
+    print('Checksum: {0} (verified)'.format(snapshot['checksum']))
+    print('Keys: {0}'.format(len(snapshot['config'])))
+    print('Sources:')
+    for source in snapshot['sources']:
+        print('  {0}'.format(source))
+    if args.show:
+        print(json.dumps(snapshot['config'], indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
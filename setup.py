@@ -9,6 +9,7 @@ with open('README.rst') as readme_file:
 extras_require = {
     'attrdict': ["attrdict>=1"],
     'yaml':  ["PyYAML>=3"],
+    'toml': ["tomli>=1; python_version < '3.11'"],
 }
 
 extras_require.update(all=sorted(set().union(*extras_require.values())))
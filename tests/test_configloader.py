@@ -4,16 +4,41 @@
 
 from __future__ import unicode_literals
 
+import array
+import collections
 import contextlib
+import datetime
+import importlib
 import io
+import json
+import os
 import random
+import subprocess
+import sys
 import tempfile
 import textwrap
+import threading
+import time
+import types
 
 import mock
 import py.test
 
-from configloader import ConfigLoader
+import configloader
+import configloader.__main__
+from configloader import (
+    CompactConfigLoader,
+    ConfigLoader,
+    Secret,
+    SecretCache,
+)
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
 
 try:
     import yaml  # noqa: F401
@@ -22,12 +47,46 @@ except ImportError:
 else:
     yaml_available = True
 
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
 
 skip_if_yaml_not_available = py.test.mark.skipif(
     not yaml_available,
     reason='PyYAML not installed',
 )
 
+try:
+    import attrdict  # noqa: F401
+except ImportError:
+    attrdict_available = False
+else:
+    attrdict_available = True
+
+skip_if_attrdict_not_available = py.test.mark.skipif(
+    not attrdict_available,
+    reason='AttrDict not installed',
+)
+
+try:
+    import tomllib  # noqa: F401
+except ImportError:
+    try:
+        import tomli  # noqa: F401
+    except ImportError:
+        toml_available = False
+    else:
+        toml_available = True
+else:
+    toml_available = True
+
+skip_if_toml_not_available = py.test.mark.skipif(
+    not toml_available,
+    reason='tomli not installed',
+)
+
 
 class test_obj:
     setting0 = 1
@@ -35,6 +94,10 @@ class test_obj:
     SETTING1 = 'blah'
 
 
+class test_obj_unserialisable:
+    SETTING0 = object()
+
+
 test_obj_output = {
     'SETTING0': 2,
     'SETTING1': 'blah',
@@ -65,6 +128,21 @@ test_yaml_output = {
 }
 
 
+test_yaml_secrets = textwrap.dedent("""
+    DB:
+      HOST: localhost
+      PASSWORD: !secret db/password
+    KEYS:
+      - !secret api/key
+      - !secret db/password
+""").strip()
+
+test_yaml_secrets_output = {
+    'DB': {'HOST': 'localhost', 'PASSWORD': 'DB/PASSWORD'},
+    'KEYS': ['API/KEY', 'DB/PASSWORD'],
+}
+
+
 test_json = textwrap.dedent("""
     {
         "SETTING3": "x",
@@ -82,6 +160,55 @@ test_json_output = {
 }
 
 
+test_toml = textwrap.dedent("""
+    SETTING1 = "x"
+    SETTING2 = [1, 2]
+    NON_ASCII = "ইঈউঊঋঌ"
+
+    [SETTING3]
+    foo = "bar"
+""").strip()
+
+
+test_ini = textwrap.dedent("""
+    [DEFAULT]
+    Timeout = 5
+
+    [SETTING1]
+    foo = bar
+    URL = %(foo)s
+
+    [NON_ASCII]
+    value = ইঈউঊঋঌ
+""").strip()
+
+test_ini_output = {
+    'SETTING1': {'foo': 'bar', 'URL': '%(foo)s', 'Timeout': '5'},
+    'NON_ASCII': {'value': 'ইঈউঊঋঌ', 'Timeout': '5'},
+}
+
+
+test_dotenv = textwrap.dedent("""
+    # Comment
+    SETTING1=x
+
+    export SETTING2 = y # Comment
+    SETTING3="a \\"quoted\\" #value\\n"
+    SETTING4='a \\n literal'
+    SETTING5=
+    NON_ASCII=ইঈউঊঋঌ
+""").strip()
+
+test_dotenv_output = {
+    'SETTING1': 'x',
+    'SETTING2': 'y',
+    'SETTING3': 'a "quoted" #value\n',
+    'SETTING4': 'a \\n literal',
+    'SETTING5': '',
+    'NON_ASCII': 'ইঈউঊঋঌ',
+}
+
+
 test_env = {
     'APP_SETTING5': 'x',
     'APP_SETTING6': 'y',
@@ -138,6 +265,54 @@ def temp_config_file(test_data):
         yield configfile.name
 
 
+class ConfigRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.client_address)
+        if self.path == '/old.json':
+            self.send_response(302)
+            self.send_header('Location', '/config.json')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = test_json.encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConfigServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+@py.test.fixture
+def config_server():
+    server = ConfigServer(('127.0.0.1', 0), ConfigRequestHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    configloader._close_connections()
+    server.shutdown()
+    server.server_close()
+    configloader._url_cache.clear()
+
+
 class TestConfigLoader:
 
     def test_init(self):
@@ -219,6 +394,46 @@ class TestConfigLoader:
         )
         assert config_loader == test_obj_output_no_criterion
 
+    def test_update_from_object_module_namespace(self, config_loader):
+        module = types.ModuleType('settings')
+        module.setting0 = 1
+        module.SETTING0 = 2
+        module.SETTING1 = 'blah'
+        config_loader.update_from_object(module)
+        assert config_loader == test_obj_output
+
+    @py.test.mark.skipif(
+        sys.version_info < (3, 4),
+        reason='module reloads are not tracked',
+    )
+    def test_update_from_object_cache(self, config_loader, tmpdir):
+        settings_file = tmpdir.join('cached_settings.py')
+        settings_file.write('SETTING0 = 2\n')
+        with mock.patch('sys.path', [str(tmpdir)] + sys.path), \
+                mock.patch.dict('sys.modules'), \
+                mock.patch('sys.dont_write_bytecode', True):
+            module = importlib.import_module('cached_settings')
+            config_loader.update_from_object(module, cache=True)
+            module.SETTING0 = 3
+            config_loader.update_from_object(module, cache=True)
+            assert config_loader == {'SETTING0': 2}
+            settings_file.write('SETTING0 = 50\n')
+            importlib.reload(module)
+            config_loader.update_from_object(module, cache=True)
+            assert config_loader == {'SETTING0': 50}
+        # Custom criteria bypass the cache
+        config_loader.update_from_object(
+            module, criterion=lambda key: key.startswith('S'), cache=True,
+        )
+        assert len(configloader._object_cache) == 1
+        module.SETTING0 = 4
+        config_loader.update_from_object(module, cache=True)
+        assert config_loader == {'SETTING0': 50}
+        ConfigLoader.clear_object_cache(module)
+        config_loader.update_from_object(module, cache=True)
+        assert config_loader == {'SETTING0': 4}
+        ConfigLoader.clear_object_cache()
+
     @skip_if_yaml_not_available
     def test_update_from_yaml_env(self, config_loader, monkeypatch):
         with temp_config_file(test_yaml) as yaml_filename:
@@ -237,6 +452,53 @@ class TestConfigLoader:
         config_loader.update_from_yaml_file(io.StringIO(test_yaml))
         assert config_loader == test_yaml_output
 
+    @skip_if_yaml_not_available
+    def test_update_from_yaml_file_secrets(self, config_loader):
+        calls = []
+
+        def resolver(refs):
+            calls.append(refs)
+            return dict((ref, ref.upper()) for ref in refs)
+
+        config_loader.update_from_yaml_file(
+            io.StringIO(test_yaml_secrets),
+            secret_resolver=resolver,
+        )
+        assert config_loader == test_yaml_secrets_output
+        assert calls == [['api/key', 'db/password']]
+        assert isinstance(config_loader['DB']['PASSWORD'], Secret)
+        assert 'DB/PASSWORD' not in repr(config_loader)
+        assert 'api/key' not in repr(config_loader)
+
+    @skip_if_yaml_not_available
+    def test_update_from_yaml_file_secret_unresolved(self, config_loader):
+        with py.test.raises(KeyError):
+            config_loader.update_from_yaml_file(
+                io.StringIO(test_yaml_secrets),
+                secret_resolver=lambda refs: {},
+            )
+
+    def test_secret_cache(self):
+        calls = []
+
+        def resolver(refs):
+            calls.append(refs)
+            return dict((ref, ref.upper()) for ref in refs)
+
+        cache = SecretCache(resolver, ttl=60, maxsize=2)
+        assert cache(['a', 'b']) == {'a': 'A', 'b': 'B'}
+        assert cache(['a', 'b']) == {'a': 'A', 'b': 'B'}
+        assert calls == [['a', 'b']]
+        cache(['c'])  # Evicts 'a', the least recently used
+        cache(['a', 'b'])
+        assert calls == [['a', 'b'], ['c'], ['a']]
+        with mock.patch('time.time', return_value=time.time() + 61):
+            cache(['a'])
+        assert calls[-1] == ['a']
+        cache.clear()
+        cache(['c'])
+        assert calls[-1] == ['c']
+
     def test_update_from_json_env(self, config_loader, monkeypatch):
         with temp_config_file(test_json) as json_filename:
             monkeypatch.setenv('CONFIG_JSON', json_filename)
@@ -252,11 +514,217 @@ class TestConfigLoader:
         config_loader.update_from_json_file(io.StringIO(test_json))
         assert config_loader == test_json_output
 
+    @skip_if_toml_not_available
+    def test_update_from_toml_env(self, config_loader, monkeypatch):
+        with temp_config_file(test_toml) as toml_filename:
+            monkeypatch.setenv('CONFIG_TOML', toml_filename)
+            config_loader.update_from_toml_env('CONFIG_TOML')
+        assert config_loader == test_yaml_output
+
+    @skip_if_toml_not_available
+    def test_update_from_toml_file(self, config_loader):
+        with temp_config_file(test_toml) as toml_filename:
+            config_loader.update_from_toml_file(toml_filename)
+        assert config_loader == test_yaml_output
+
+    @skip_if_toml_not_available
+    def test_update_from_toml_file_obj(self, config_loader):
+        config_loader.update_from_toml_file(io.StringIO(test_toml))
+        assert config_loader == test_yaml_output
+
+    def test_update_from_ini_env(self, config_loader, monkeypatch):
+        with temp_config_file(test_ini) as ini_filename:
+            monkeypatch.setenv('CONFIG_INI', ini_filename)
+            config_loader.update_from_ini_env('CONFIG_INI')
+        assert config_loader == test_ini_output
+
+    def test_update_from_ini_file(self, config_loader):
+        with temp_config_file(test_ini) as ini_filename:
+            config_loader.update_from_ini_file(ini_filename)
+        assert config_loader == test_ini_output
+
+    def test_update_from_ini_file_obj(self, config_loader):
+        config_loader.update_from_ini_file(io.StringIO(test_ini))
+        assert config_loader == test_ini_output
+
+    def test_update_from_dotenv_env(self, config_loader, monkeypatch):
+        with temp_config_file(test_dotenv) as dotenv_filename:
+            monkeypatch.setenv('CONFIG_DOTENV', dotenv_filename)
+            config_loader.update_from_dotenv_env('CONFIG_DOTENV')
+        assert config_loader == test_dotenv_output
+
+    def test_update_from_dotenv_file(self, config_loader):
+        with temp_config_file(test_dotenv) as dotenv_filename:
+            config_loader.update_from_dotenv_file(dotenv_filename)
+        assert config_loader == test_dotenv_output
+
+    def test_update_from_dotenv_file_obj(self, config_loader):
+        config_loader.update_from_dotenv_file(io.StringIO(test_dotenv))
+        assert config_loader == test_dotenv_output
+
+    @py.test.mark.parametrize('line', ['SETTING1', '=x', 'SETTING1="x'])
+    def test_update_from_dotenv_file_invalid(self, config_loader, line):
+        with py.test.raises(ValueError):
+            config_loader.update_from_dotenv_file(io.StringIO(line))
+
+    def test_update_from_url(self, config_loader, config_server):
+        url = 'http://127.0.0.1:{0}/config.json'.format(
+            config_server.server_address[1],
+        )
+        config_loader.update_from_url(url)
+        assert config_loader == test_json_output
+        config_loader.clear()
+        config_loader.update_from_url(url)
+        assert config_loader == test_json_output
+        # The second request was answered with a 304 on the same connection
+        assert len(config_server.requests) == 2
+        assert len(set(config_server.requests)) == 1
+
+    def test_update_from_url_redirect(self, config_loader, config_server):
+        url = 'http://127.0.0.1:{0}/old.json'.format(
+            config_server.server_address[1],
+        )
+        config_loader.update_from_url(url)
+        assert config_loader == test_json_output
+
+    def test_update_from_url_cache_path(
+            self,
+            config_loader,
+            config_server,
+            tmpdir,
+            ):
+        url = 'http://127.0.0.1:{0}/config.json'.format(
+            config_server.server_address[1],
+        )
+        cache_path = str(tmpdir.join('config.cache'))
+        config_loader.update_from_url(url, cache_path=cache_path)
+        configloader._close_connections()
+        config_server.shutdown()
+        config_server.server_close()
+        configloader._url_cache.clear()
+        config_loader.clear()
+        config_loader.update_from_url(url, cache_path=cache_path)
+        assert config_loader == test_json_output
+
+    def test_update_from_url_format(self, config_loader):
+        with py.test.raises(ValueError):
+            config_loader.update_from_url('http://localhost/', format='xml')
+
     def test_update_from_env_namespace(self, config_loader):
         with mock.patch('os.environ', test_env):
             config_loader.update_from_env_namespace('APP')
         assert config_loader == test_env_output
 
+    def test_update_from_env_nested(self, config_loader):
+        db = {'host': 'localhost', 'pool': {'size': 5, 'timeout': 1.5}}
+        config_loader.update(
+            DB=db,
+            DEBUG=False,
+            HOSTS=['a'],
+            NAME='app',
+        )
+        env = {
+            'APP__DB__POOL__SIZE': '20',
+            'APP__DB__POOL__TIMEOUT': '2.5',
+            'APP__DB__PORT': '5432',
+            'APP__DEBUG': 'true',
+            'APP__HOSTS': '["b", "c"]',
+            'APP__NAME': 'other',
+            'APP__': 'ignored',
+            'OTHER__NAME': 'ignored',
+        }
+        with mock.patch('os.environ', env):
+            config_loader.update_from_env_nested('APP')
+        assert config_loader == {
+            'DB': {
+                'host': 'localhost',
+                'pool': {'size': 20, 'timeout': 2.5},
+                'PORT': '5432',
+            },
+            'DEBUG': True,
+            'HOSTS': ['b', 'c'],
+            'NAME': 'other',
+        }
+        # Nested dicts are replaced, not modified
+        assert db == {'host': 'localhost', 'pool': {'size': 5, 'timeout': 1.5}}
+
+    def test_update_from_env_nested_list(self, config_loader):
+        hosts = ['a', {'name': 'b', 'port': 1}]
+        config_loader.update(HOSTS=hosts, DB=None)
+        env = {
+            'APP__HOSTS__0': 'z',
+            'APP__HOSTS__1__PORT': '2',
+            'APP__DB__HOST': 'localhost',
+        }
+        with mock.patch('os.environ', env):
+            config_loader.update_from_env_nested('APP')
+        assert config_loader == {
+            'HOSTS': ['z', {'name': 'b', 'port': 2}],
+            'DB': {'HOST': 'localhost'},
+        }
+        assert hosts == ['a', {'name': 'b', 'port': 1}]
+
+    @py.test.mark.parametrize('name', [
+        'APP__DB__PORT',
+        'APP__DB__PORT__NUMBER',
+        'APP__URL__HOST',
+        'APP__HOSTS__2',
+        'APP__HOSTS__-1',
+        'APP__HOSTS__X',
+    ])
+    def test_update_from_env_nested_invalid(self, config_loader, name):
+        config = {'DB': {'PORT': 5432}, 'URL': 'sqlite://', 'HOSTS': ['a']}
+        config_loader.update(config)
+        with mock.patch('os.environ', {name: 'x'}):
+            with py.test.raises(ValueError):
+                config_loader.update_from_env_nested('APP')
+        assert config_loader == config
+
+    def test_get_path(self, config_loader):
+        config_loader.update(test_yaml_output)
+        assert config_loader.get_path('SETTING3.foo') == 'bar'
+        assert config_loader.get_path(['SETTING3', 'foo']) == 'bar'
+        assert config_loader.get_path('SETTING2.1') == 2
+        assert config_loader.get_path('SETTING3.bar', default=None) is None
+        assert config_loader.get_path('SETTING2.5', default=None) is None
+        assert config_loader.get_path('SETTING1.foo', default=None) is None
+        with py.test.raises(KeyError):
+            config_loader.get_path('SETTING3.bar')
+
+    def test_accessor(self, config_loader):
+        config_loader.update(test_yaml_output)
+        accessor = config_loader.accessor('SETTING3.foo')
+        missing = config_loader.accessor('SETTING4.foo', default=1)
+        assert accessor() == 'bar'
+        assert missing() == 1
+        with mock.patch('configloader._get_path') as mock_get_path:
+            assert accessor() == 'bar'
+            assert not mock_get_path.called
+        config_loader['SETTING3'] = {'foo': 'baz'}
+        assert accessor() == 'baz'
+        config_loader.update(SETTING4={'foo': 2})
+        assert missing() == 2
+        del config_loader['SETTING3']
+        with py.test.raises(KeyError):
+            accessor()
+        config_loader.setdefault('SETTING3', {'foo': 'qux'})
+        assert accessor() == 'qux'
+        config_loader.pop('SETTING3')
+        config_loader.clear()
+        assert missing() == 1
+        config_loader |= {'SETTING4': {'foo': 3}}
+        assert missing() == 3
+
+    @skip_if_attrdict_not_available
+    def test_attrdict(self, config_loader):
+        config_loader.update(test_json_output)
+        config_loader['SETTING6'] = 1
+        config_loader.SETTING7 = 2
+        assert config_loader.SETTING5.foo == 'bar'
+        assert config_loader.SETTING7 == 2
+        assert config_loader.version == 3
+        assert config_loader.accessor('SETTING5.foo')() == 'bar'
+
     def test_namespace(self, config_loader):
         config_loader.update(test_config_namespace)
         assert config_loader.namespace('PART1') == \
@@ -275,5 +743,218 @@ class TestConfigLoader:
         # No error raised when non-existant env var is given.
         config_loader._update_from_env(str(random.randint(1e10, 1e12)), None)
 
+    def test_version(self, config_loader):
+        assert config_loader.version == 0
+        config_loader.update_from_json_file(io.StringIO(test_json))
+        assert config_loader.version == 1
+        with mock.patch('os.environ', test_env):
+            config_loader.update_from_env_namespace('APP')
+        assert config_loader.version == 2
+        config_loader.update({'A': 1}, B=2)
+        assert config_loader.version == 3
+        config_loader['C'] = 3
+        assert config_loader.version == 4
+
+    def test_snapshot(self, config_loader):
+        config_loader.update_from_json_file(io.StringIO(test_json))
+        snapshot = config_loader.snapshot()
+        config_loader['SETTING3'] = 'y'
+        assert snapshot == test_json_output
+        assert type(snapshot) is ConfigLoader
+        assert snapshot.version == 1
+        assert config_loader.version == 2
+
+    def test_concurrent_update(self, config_loader):
+        def generation(number):
+            return dict(('KEY_{0}'.format(i), number) for i in range(200))
+
+        config_loader.update(generation(0))
+        errors = []
+        done = threading.Event()
+
+        def read():
+            last_version = 0
+            while not done.is_set():
+                snapshot = config_loader.snapshot()
+                if len(set(snapshot.values())) != 1:
+                    errors.append('torn read')
+                if len(set(config_loader.namespace('KEY').values())) != 1:
+                    errors.append('torn namespace')
+                if snapshot.version < last_version:
+                    errors.append('version went backwards')
+                last_version = snapshot.version
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            for number in range(1, 200):
+                config_loader.update_from_json_file(
+                    io.StringIO(json.dumps(generation(number)))
+                )
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+        assert errors == []
+        assert config_loader.version == 200
+
+    def test_stress_harness(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                os.path.join(root, 'benchmarks', 'stress.py'),
+                '--size', '100',
+                '--duration', '0.5',
+                '--readers', '2',
+            ],
+            env=dict(os.environ, PYTHONPATH=root),
+        )
+        assert b'item reads' in output
+        assert b'ERROR' not in output
+
+    def test_sources(self, config_loader):
+        with temp_config_file(test_json) as json_filename:
+            config_loader.update_from(obj=test_obj, json_file=json_filename)
+            config_loader.update_from_json_file(io.StringIO(test_json))
+            assert config_loader.sources == [
+                'object:test_obj',
+                'file:{0}'.format(os.path.abspath(json_filename)),
+                'file:<stream>',
+            ]
+
+    @py.test.mark.parametrize('format', [
+        'json',
+        py.test.param('yaml', marks=skip_if_yaml_not_available),
+    ])
+    def test_dump(self, config_loader, tmpdir, format):
+        path = str(tmpdir.join('snapshot'))
+        config_loader.update_from_json_file(io.StringIO(test_json))
+        config_loader.update(SECRET=Secret('x'), ITEMS=(1, 2))
+        config_loader.dump(path, format=format)
+        config = ConfigLoader.load_snapshot(path, format=format)
+        assert config == dict(test_json_output, SECRET='x', ITEMS=[1, 2])
+        assert config.sources == ['file:<stream>']
+        assert os.listdir(str(tmpdir)) == ['snapshot']
+
+    @skip_if_yaml_not_available
+    def test_dump_yaml_values(self, config_loader, tmpdir):
+        path = str(tmpdir.join('snapshot.yaml'))
+        config_loader.update_from_yaml_file(io.StringIO('D: 2020-01-01'))
+        config_loader.dump(path, format='yaml')
+        config = ConfigLoader.load_snapshot(path, format='yaml')
+        assert config == {'D': datetime.date(2020, 1, 1)}
+        with py.test.raises(ValueError):
+            config_loader.dump(str(tmpdir.join('snapshot.json')))
+        assert os.listdir(str(tmpdir)) == ['snapshot.yaml']
+
+    def test_load_snapshot_invalid(self, config_loader, tmpdir):
+        path = str(tmpdir.join('snapshot.json'))
+        config_loader.update(X=1)
+        config_loader.dump(path)
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        for changes in [
+                {'config': {'X': 2}},
+                {'configloader_snapshot': 99},
+                ]:
+            with open(path, 'w') as snapshot_file:
+                json.dump(dict(snapshot, **changes), snapshot_file)
+            with py.test.raises(ValueError):
+                ConfigLoader.load_snapshot(path)
+        with open(path, 'w') as snapshot_file:
+            json.dump({'X': 1}, snapshot_file)
+        with py.test.raises(ValueError):
+            ConfigLoader.load_snapshot(path)
+
+    def test_cli(self, tmpdir, capsys):
+        path = str(tmpdir.join('snapshot.json'))
+        with temp_config_file(test_json) as json_filename:
+            assert configloader.__main__.main(
+                ['build', path, '--json-file', json_filename],
+            ) == 0
+        assert configloader.__main__.main(['inspect', path, '--show']) == 0
+        out = capsys.readouterr()[0]
+        assert 'Keys: 4' in out
+        assert 'file:' in out
+        assert '"SETTING3": "x"' in out
+        tmpdir.join('snapshot.json').write('{}')
+        assert configloader.__main__.main(['inspect', path]) == 1
+        with mock.patch.dict('sys.modules', settings=test_obj_unserialisable):
+            assert configloader.__main__.main(
+                ['build', path, '--obj', 'settings'],
+            ) == 1
+
     def test_repr(self):
         assert repr(ConfigLoader(X=1)) == "ConfigLoader({'X': 1})"
+
+    def test_compact(self, config_loader):
+        config_loader.update_from_json_file(io.StringIO(test_json))
+        config_loader.compact()
+        assert config_loader == test_json_output
+        config2 = ConfigLoader()
+        config2.update_from_json_file(io.StringIO(test_json))
+        config2.compact()
+        assert config_loader['SETTING3'] is config2['SETTING3']
+        assert config_loader['SETTING5']['foo'] is config2['SETTING5']['foo']
+
+    def test_compact_arrays(self, config_loader):
+        config_loader.update(A=[1, 2], B=[1.5], C=[1, 'x'], D=[True], E=[])
+        config_loader.compact(arrays=True)
+        assert config_loader['A'] == array.array('l', [1, 2])
+        assert config_loader['B'] == array.array('d', [1.5])
+        assert config_loader['C'] == [1, 'x']
+        assert config_loader['D'] == [True]
+        assert config_loader['E'] == []
+
+    def test_compact_other_types(self, config_loader):
+        defaults = collections.defaultdict(int, A='x')
+        config_loader.update(SECRET=Secret('x'), DEFAULTS=defaults)
+        config_loader.compact()
+        assert type(config_loader['SECRET']) is Secret
+        assert config_loader['DEFAULTS'] == {'A': 'x'}
+        assert config_loader['DEFAULTS']['B'] == 0
+
+    def test_compact_config_loader(self):
+        config = CompactConfigLoader()
+        config.update_from_json_file(io.StringIO(test_json))
+        assert config == test_json_output
+        config2 = CompactConfigLoader()
+        config2.update_from_json_file(io.StringIO(test_json))
+        assert config['SETTING3'] is config2['SETTING3']
+        assert type(config.namespace('SETTING')) is CompactConfigLoader
+
+    @py.test.mark.skipif(tracemalloc is None, reason='tracemalloc missing')
+    def test_compact_memory(self):
+        # Several tenants sharing the same keys and most of the same values
+        data = [
+            json.dumps(dict(
+                ('TENANT{0}_SETTING{1}'.format(tenant, i), {
+                    'host': 'db-{0}.internal.example.com'.format(i % 10),
+                    'weights': [j / 4.0 for j in range(i % 20)],
+                })
+                for i in range(500)
+            ))
+            for tenant in range(4)
+        ]
+
+        def measure(config_class, **compact_kwargs):
+            tracemalloc.start()
+            try:
+                config = config_class()
+                for chunk in data:
+                    config.update_from_json_file(io.StringIO(chunk))
+                if compact_kwargs:
+                    config.compact(**compact_kwargs)
+                return tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+
+        plain = measure(ConfigLoader)
+        compact = measure(CompactConfigLoader)
+        arrays = measure(CompactConfigLoader, arrays=True)
+        report = 'plain: {0} bytes, compact: {1} bytes, arrays: {2} bytes'
+        report = report.format(plain, compact, arrays)
+        assert compact < plain, report
+        assert arrays < compact, report